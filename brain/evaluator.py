@@ -22,8 +22,8 @@ class ModelEvaluator:
         """Оценка качества сгенерированного ответа (0-1)"""
         inputs_gen = self.tokenizer(generated, return_tensors='pt').to(self.device)
         inputs_ref = self.tokenizer(reference, return_tensors='pt').to(self.device)
-        
-        with torch.no_grad():
+
+        with torch.inference_mode():
             outputs_gen = self.model(**inputs_gen)
             outputs_ref = self.model(**inputs_ref)
             
@@ -60,8 +60,10 @@ class ModelEvaluator:
         }
         
         dataloader = torch.utils.data.DataLoader(dataset, batch_size=4)
-        
-        with torch.no_grad():
+
+        # inference_mode строго быстрее no_grad: не ведет version counters
+        # и view tracking для autograd
+        with torch.inference_mode():
             for i, batch in enumerate(tqdm(dataloader, desc="Evaluation")):
                 if i >= sample_size // 4:
                     break
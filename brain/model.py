@@ -72,6 +72,36 @@ class SinModel(nn.Module):
             return "Извините, произошла ошибка"
 
 
+    def generate_response_from_ids(self, input_ids, max_new_tokens=100, temperature=0.7):
+        """Генерация по уже токенизированному промпту (без повторной токенизации)"""
+        try:
+            input_ids = input_ids.to(self.device)
+            attention_mask = torch.ones_like(input_ids)
+
+            with torch.no_grad():
+                outputs = self.base_model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_k=50,
+                    top_p=0.9,
+                    repetition_penalty=1.2,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    do_sample=True
+                )
+
+            # Декодируем только новые токены, промпт не трогаем
+            response = self.tokenizer.decode(
+                outputs[0][input_ids.shape[-1]:],
+                skip_special_tokens=True
+            )
+            return response.split("\n")[0].strip()
+
+        except Exception as e:
+            print(f"Ошибка генерации: {str(e)}")
+            return "Извините, произошла ошибка"
+
     def save(self, path):
         """Сохранение модели с обработкой ошибок"""
         try:
@@ -1,73 +1,218 @@
-import matplotlib.pyplot as plt
+import atexit
+import gc
+import multiprocessing
+import os
 import numpy as np
 import json
+try:
+    import orjson  # C-расширение, сериализует в разы быстрее stdlib json
+except ImportError:
+    orjson = None
 from pathlib import Path
 import logging
 logger = logging.getLogger(__name__)
 
+
+def _plot_worker(queue, plot_path):
+    """Рабочий процесс отрисовки: matplotlib не потокобезопасен,
+    поэтому рендеринг и запись PNG выносятся из процесса обучения."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    try:
+        import imageio
+    except ImportError:
+        imageio = None
+
+    # Одна фигура на весь процесс: пересоздание Figure и plt.close()
+    # на каждом кадре - самая дорогая часть pyplot
+    fig, (ax_loss, ax_metrics) = plt.subplots(1, 2, figsize=(12, 6))
+
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        epochs, train_loss, val_loss, metrics = item
+
+        # График потерь
+        ax_loss.clear()
+        ax_loss.plot(epochs, train_loss, label="Train")
+        if len(val_loss):
+            ax_loss.plot(epochs[:len(val_loss)], val_loss, label="Val")
+        ax_loss.set_title("Training Loss")
+        ax_loss.set_xlabel("Epoch")
+        ax_loss.legend()
+        ax_loss.grid()
+
+        # График метрик
+        ax_metrics.clear()
+        for metric, values in metrics.items():
+            if len(values):
+                ax_metrics.plot(epochs[:len(values)], values, label=metric)
+        ax_metrics.set_title("Validation Metrics")
+        ax_metrics.set_xlabel("Epoch")
+        ax_metrics.legend()
+        ax_metrics.grid()
+
+        fig.tight_layout()
+        if imageio is not None:
+            # Прямая запись RGBA-буфера быстрее savefig:
+            # без повторного рендеринга и машинерии pyplot
+            fig.canvas.draw()
+            imageio.imwrite(plot_path, np.asarray(fig.canvas.buffer_rgba()))
+        else:
+            fig.savefig(plot_path)
+
+    # Повторный цикл figure()/close() утекает память до ручного gc.collect(),
+    # поэтому фигура живет весь процесс и закрывается один раз на выходе
+    plt.close(fig)
+    gc.collect()
+
+class _GrowableArray:
+    """Массив с предвыделенной емкостью и амортизированным O(1) append.
+
+    Хранение в numpy вместо python-списков дает matplotlib и np.argmax
+    готовые ndarray-представления без переконвертации на каждый вызов.
+    """
+
+    def __init__(self, dtype=np.float32, capacity=1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._len = 0
+
+    def append(self, value):
+        if self._len == len(self._data):
+            # Удвоение емкости при переполнении
+            grown = np.empty(len(self._data) * 2, dtype=self._data.dtype)
+            grown[:self._len] = self._data
+            self._data = grown
+        self._data[self._len] = value
+        self._len += 1
+
+    def view(self):
+        """Представление заполненной части без копирования"""
+        return self._data[:self._len]
+
+    def __len__(self):
+        return self._len
+
+
 class TrainingMonitor:
-    def __init__(self, log_dir="data/logs"):
+    def __init__(self, log_dir="data/logs", plot_every=10):
         self.logger = logging.getLogger(__name__)
         self.log_dir = Path(log_dir)
-        
+        self.plot_every = plot_every
+
         try:
             self.log_dir.mkdir(exist_ok=True, parents=True)
             self.reset_logs()
+            self._plot_queue = multiprocessing.Queue()
+            self._plot_process = multiprocessing.Process(
+                target=_plot_worker,
+                args=(self._plot_queue, str(self.log_dir / "training_progress.png")),
+                daemon=True
+            )
+            self._plot_process.start()
+            atexit.register(self._shutdown_plotter)
             self.logger.info("Training monitor initialized")
         except Exception as e:
             self.logger.critical(f"Failed to initialize monitor: {str(e)}")
             raise
 
+    def reset_logs(self):
+        """Сброс логов текущего обучения"""
+        self._epochs = _GrowableArray(dtype=np.int64)
+        self._train_loss = _GrowableArray()
+        self._val_loss = _GrowableArray()
+        self._metrics = {
+            "accuracy": _GrowableArray(),
+            "perplexity": _GrowableArray(),
+            "similarity": _GrowableArray()
+        }
+        # Лучшее значение каждой метрики: metric -> (value, epoch)
+        self._best = {}
+
+    @property
+    def current_log(self):
+        """Логи в виде обычных списков (для отчетов и обратной совместимости)"""
+        return {
+            "epochs": self._epochs.view().tolist(),
+            "train_loss": self._train_loss.view().tolist(),
+            "val_loss": self._val_loss.view().tolist(),
+            "metrics": {
+                metric: values.view().tolist()
+                for metric, values in self._metrics.items()
+            }
+        }
+
     def log_epoch(self, epoch, train_loss, val_metrics=None):
         try:
-            self.current_log["epochs"].append(epoch)
-            self.current_log["train_loss"].append(train_loss)
-            
+            self._epochs.append(epoch)
+            self._train_loss.append(train_loss)
+
             if val_metrics:
+                if "loss" in val_metrics:
+                    self._val_loss.append(val_metrics["loss"])
                 for metric, value in val_metrics.items():
-                    if metric in self.current_log["metrics"]:
-                        self.current_log["metrics"][metric].append(value)
-            
+                    if metric in self._metrics:
+                        self._metrics[metric].append(value)
+                        if metric not in self._best or value > self._best[metric][0]:
+                            self._best[metric] = (value, epoch)
+
             self._save_log()
-            self._plot_progress()
+            # Отрисовка графиков дорогая, поэтому делаем ее раз в plot_every эпох
+            if epoch % self.plot_every == 0:
+                self._plot_progress()
             self.logger.debug(f"Logged epoch {epoch} data")
-            
+
         except Exception as e:
             self.logger.error(f"Failed to log epoch {epoch}: {str(e)}", exc_info=True)
             raise
+
+    def finalize(self):
+        """Финальная отрисовка графиков после окончания обучения"""
+        if len(self._epochs):
+            self._plot_progress()
     
     def _save_log(self):
-        with open(self.log_dir / "training_log.json", "w") as f:
-            json.dump(self.current_log, f, indent=2)
+        # Сериализуем в память и пишем одним вызовом через временный файл:
+        # один syscall вместо множества мелких write() у json.dump,
+        # и os.replace гарантирует, что лог не останется недописанным
+        if orjson is not None:
+            # orjson сериализует ndarray напрямую, без tolist()-копий
+            payload = orjson.dumps(
+                {
+                    "epochs": self._epochs.view(),
+                    "train_loss": self._train_loss.view(),
+                    "val_loss": self._val_loss.view(),
+                    "metrics": {m: v.view() for m, v in self._metrics.items()}
+                },
+                option=orjson.OPT_SERIALIZE_NUMPY
+            )
+        else:
+            payload = json.dumps(self.current_log, separators=(",", ":")).encode()
+        tmp_path = self.log_dir / "training_log.json.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.log_dir / "training_log.json")
     
     def _plot_progress(self):
-        plt.figure(figsize=(12, 6))
-        
-        # График потерь
-        plt.subplot(1, 2, 1)
-        plt.plot(self.current_log["epochs"], self.current_log["train_loss"], label="Train")
-        if self.current_log["val_loss"]:
-            plt.plot(self.current_log["epochs"], self.current_log["val_loss"], label="Val")
-        plt.title("Training Loss")
-        plt.xlabel("Epoch")
-        plt.legend()
-        plt.grid()
-        
-        # График метрик
-        plt.subplot(1, 2, 2)
-        for metric, values in self.current_log["metrics"].items():
-            if values:
-                plt.plot(self.current_log["epochs"], values, label=metric)
-        plt.title("Validation Metrics")
-        plt.xlabel("Epoch")
-        plt.legend()
-        plt.grid()
-        
-        plt.tight_layout()
-        plt.savefig(self.log_dir / "training_progress.png")
-        plt.close()
-    
+        # Передаем копии данных рабочему процессу и сразу возвращаемся,
+        # не дожидаясь рендеринга и записи PNG
+        self._plot_queue.put((
+            self._epochs.view().copy(),
+            self._train_loss.view().copy(),
+            self._val_loss.view().copy(),
+            {metric: values.view().copy() for metric, values in self._metrics.items()}
+        ))
+
+    def _shutdown_plotter(self):
+        if self._plot_process.is_alive():
+            self._plot_queue.put(None)
+            self._plot_process.join()
+
     def get_best_epoch(self, metric="accuracy"):
-        if not self.current_log["metrics"].get(metric):
+        # O(1): лучшее значение поддерживается инкрементально в log_epoch,
+        # без np.argmax по всему списку на каждый вызов
+        if metric not in self._best:
             return -1
-        return int(np.argmax(self.current_log["metrics"][metric])) + 1
+        return self._best[metric][1]
@@ -0,0 +1,79 @@
+import logging
+logger = logging.getLogger(__name__)
+
+# Бит на каждую известную черту: проверка в format_response сводится
+# к одному целочисленному И вместо линейного поиска по спискам
+_TRAIT_BIT = {
+    'аналитичный': 1,
+    'креативный': 2,
+    'дружелюбный': 4,
+    'серьезный': 8,
+    'игривый': 16,
+}
+
+
+class PersonalityCore:
+    # Таблицы заморожены при загрузке класса: frozenset/tuple нельзя
+    # случайно мутировать, а проверки принадлежности не создают мусора
+    ARCHETYPES = {
+        'neutral': {
+            'traits': frozenset(),
+            'phrases': ()
+        },
+        'analyst': {
+            'traits': frozenset(('аналитичный', 'серьезный')),
+            'phrases': ('Если рассуждать логически...', 'Давай разберемся по шагам.')
+        },
+        'creative': {
+            'traits': frozenset(('креативный', 'игривый')),
+            'phrases': ('А что если...', 'У меня есть необычная идея!')
+        },
+        'friend': {
+            'traits': frozenset(('дружелюбный', 'игривый')),
+            'phrases': ('Рад тебя видеть!', 'Всегда готов помочь.')
+        }
+    }
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.current_archetype = self.ARCHETYPES['neutral']
+        self._base_traits = self.current_archetype['traits']
+        self.custom_traits = []
+        self._custom_traits_set = set()
+        self._trait_flags = 0
+
+    def set_archetype(self, name):
+        """Переключение архетипа личности"""
+        if name not in self.ARCHETYPES:
+            raise ValueError(f"Unknown archetype: {name}")
+        self.current_archetype = self.ARCHETYPES[name]
+        self._base_traits = self.current_archetype['traits']
+        self._rebuild_flags()
+        self.logger.info(f"Archetype set to {name}")
+
+    def add_trait(self, trait):
+        """Добавление пользовательской черты поверх архетипа"""
+        if trait not in self._custom_traits_set:
+            self.custom_traits.append(trait)
+            self._custom_traits_set.add(trait)
+            self._trait_flags |= _TRAIT_BIT.get(trait, 0)
+
+    def has_trait(self, trait):
+        """Активна ли черта (архетип или пользовательская) - O(1), без аллокаций"""
+        return trait in self._base_traits or trait in self._custom_traits_set
+
+    def _rebuild_flags(self):
+        flags = 0
+        for trait in self.current_archetype['traits']:
+            flags |= _TRAIT_BIT.get(trait, 0)
+        for trait in self.custom_traits:
+            flags |= _TRAIT_BIT.get(trait, 0)
+        self._trait_flags = flags
+
+    def format_response(self, message):
+        """Стилизация ответа под активные черты: битовые проверки, без аллокаций"""
+        if self._trait_flags & _TRAIT_BIT['аналитичный']:
+            message = "🤔 " + message
+        if self._trait_flags & _TRAIT_BIT['игривый']:
+            message = message + " 😊"
+        return message
@@ -93,8 +93,16 @@ class SinTrainer:
             'similarity': metrics.get('semantic_similarity', 0.0)
         }
 
-    def get_data_loader(self, dataset, batch_size=4):
-        return DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    def get_data_loader(self, dataset, batch_size=4, num_workers=0):
+        # persistent_workers сохраняет процессы-воркеры между эпохами,
+        # убирая стоимость их перезапуска (допустимо только при num_workers > 0)
+        return DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=True,
+            num_workers=num_workers,
+            persistent_workers=num_workers > 0
+        )
 
     def train_step(self, batch):
         inputs = batch['input_ids'].to(self.device)
@@ -109,6 +117,8 @@ class SinTrainer:
     def load_json_data(self, file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
+        if 'dialogues' not in data:
+            raise ValueError(f"No 'dialogues' key in {file_path}")
         return self._create_dataset(data['dialogues'])
 
     def load_text_data(self, file_path):
@@ -1,5 +1,12 @@
+import io
 import os
+import re
 import json
+import concurrent.futures
+try:
+    import orjson  # C-расширение, парсит JSON в разы быстрее stdlib json
+except ImportError:
+    orjson = None
 import torch
 import logging
 from pathlib import Path
@@ -9,10 +16,15 @@ from brain.memory import SinMemory
 from brain.trainer import SinTrainer
 from brain.evaluator import ModelEvaluator
 from brain.monitor import TrainingMonitor
+from brain.personality import PersonalityCore
 from torch.optim.lr_scheduler import CosineAnnealingLR
 
 logger = logging.getLogger(__name__)
 
+# Текст после последнего 'Sin:' до конца строки - один проход по ответу
+# вместо цепочки split/strip с четырьмя промежуточными списками
+_RESP_RE = re.compile(r'.*Sin:\s*([^\n]*)', re.DOTALL)
+
 class Sin:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
@@ -38,6 +50,17 @@ class Sin:
             
             self.logger.info("Initializing monitor...")
             self.monitor = TrainingMonitor()
+
+            self.logger.info("Initializing personality...")
+            self.personality = PersonalityCore()
+
+            # Один фоновый поток пишет чекпоинты, чтобы не блокировать обучение
+            self._ckpt_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._ckpt_future = None
+
+            # Кэш токенов контекста: каждая реплика кодируется один раз
+            self._ctx_ids_cache = {}
+            self._sin_cue_ids = self.model.tokenizer.encode("Sin:", add_special_tokens=False)
             
             self.logger.info("Loading saved state...")
             self.load()
@@ -69,34 +92,56 @@ class Sin:
             self.logger.debug("Adding interaction to memory")
             self.memory.add_interaction(user_input, "")
         
-            # Формируем контекст
-            context = "\n".join(list(self.memory.context)[-4:])
-            self.logger.debug(f"Current context: {context}")
-        
-            prompt = f"{context}\nSin:"
-            self.logger.debug(f"Generated prompt: {prompt}")
-        
+            # Формируем контекст из уже токенизированных реплик
+            context_lines = list(self.memory.context)[-4:]
+            prompt_ids = self._encode_context(context_lines)
+            self.logger.debug(f"Current context: {context_lines}")
+
             # Генерация ответа
             self.logger.info("Generating response...")
-            response = self.model.generate_response(prompt)
+            response = self.model.generate_response_from_ids(prompt_ids)
             self.logger.debug(f"Raw response: {response}")
         
             # Очистка ответа
-            clean_response = response.split("Sin:")[-1].strip()
-            clean_response = clean_response.split("\n")[0].strip()
+            m = _RESP_RE.match(response)
+            clean_response = m.group(1).strip() if m else response.strip()
             self.logger.debug(f"Cleaned response: {clean_response}")
         
             # Сохранение в память
             self.memory.add_interaction(user_input, clean_response)
             self.logger.info(f"Returning response: {clean_response}")
         
-            return clean_response if clean_response else "Не могу сформулировать ответ"
+            if not clean_response:
+                return "Не могу сформулировать ответ"
+            return self.personality.format_response(clean_response)
         
         except Exception as e:
             self.logger.error(f"Error in chat(): {str(e)}", exc_info=True)
             return "Произошла ошибка при генерации ответа"
 
-    def train(self, epochs=3, val_dataset=None):
+    def _encode_context(self, lines):
+        """Сборка промпта из кэшированных токенов реплик + затравки 'Sin:'"""
+        ids = []
+        for line in lines:
+            line_ids = self._ctx_ids_cache.get(line)
+            if line_ids is None:
+                line_ids = self.model.tokenizer.encode(
+                    line + "\n", add_special_tokens=False
+                )
+                self._ctx_ids_cache[line] = line_ids
+            ids.extend(line_ids)
+
+        # Не даем кэшу расти за пределы текущего окна контекста
+        if len(self._ctx_ids_cache) > 32:
+            keep = set(lines)
+            self._ctx_ids_cache = {
+                k: v for k, v in self._ctx_ids_cache.items() if k in keep
+            }
+
+        ids.extend(self._sin_cue_ids)
+        return torch.tensor([ids])
+
+    def train(self, epochs=3, val_dataset=None, checkpoint_freq=1):
         """Обучение с валидацией"""
         self.logger.info(f"Starting training for {epochs} epochs")
     
@@ -112,82 +157,174 @@ class Sin:
             # Валидация перед обучением
             if val_dataset:
                 self.logger.info("Running initial validation...")
-                init_metrics = self.evaluate(val_dataset)
+                self.model.eval()
+                with torch.inference_mode():
+                    init_metrics = self.evaluate(val_dataset)
                 self.logger.info(f"Initial metrics: {init_metrics}")
         
             optimizer = torch.optim.AdamW(self.model.parameters(), lr=5e-5)
             scheduler = CosineAnnealingLR(optimizer, epochs)
-        
+
+            # Один DataLoader на все эпохи: при num_workers > 0 воркеры
+            # остаются живыми и не форкаются заново каждую эпоху
+            train_loader = self.trainer.get_data_loader(train_dataset)
+            n_samples = len(train_dataset)
+
             for epoch in range(epochs):
                 self.logger.info(f"Starting epoch {epoch+1}/{epochs}")
                 self.model.train()
-                total_loss = 0
-            
+                # Аккумулируем на устройстве: .item() на каждом батче - это
+                # синхронизация хоста с GPU, оставляем ее раз в 50 батчей и
+                # один раз в конце эпохи
+                total_loss = torch.zeros((), device=self.model.device)
+
                 try:
-                    for batch_idx, batch in enumerate(self.trainer.get_data_loader(train_dataset)):
-                        optimizer.zero_grad()
+                    for batch_idx, batch in enumerate(train_loader):
+                        optimizer.zero_grad(set_to_none=True)
                         loss = self.trainer.train_step(batch)
                         loss.backward()
                         optimizer.step()
-                        total_loss += loss.item()
-                    
+                        total_loss += loss.detach()
+
                         if batch_idx % 50 == 0:
                             self.logger.debug(
                                 f"Epoch {epoch+1} | Batch {batch_idx} | Loss: {loss.item():.4f}"
                             )
-                
+
                     scheduler.step()
-                
-                    # Валидация после эпохи
+                    total_loss = total_loss.item()
+
+                    # Валидация после эпохи: eval-режим (dropout выключен)
+                    # и inference_mode - быстрее no_grad, без метаданных autograd
                     val_metrics = None
                     if val_dataset:
                         self.logger.info("Running validation...")
-                        val_metrics = self.evaluate(val_dataset)
+                        self.model.eval()
+                        with torch.inference_mode():
+                            val_metrics = self.evaluate(val_dataset)
+                        self.model.train()
                         self.logger.info(f"Validation metrics: {val_metrics}")
                 
                     self.monitor.log_epoch(epoch+1, total_loss, val_metrics)
                     self.logger.info(
-                        f"Epoch {epoch+1} complete | Avg Loss: {total_loss/len(train_dataset):.4f}"
+                        f"Epoch {epoch+1} complete | Avg Loss: {total_loss/n_samples:.4f}"
                     )
-                
+
+                    # Промежуточные чекпоинты: только веса, полное сохранение
+                    # (модель + память) делается один раз после обучения
+                    if (epoch + 1) % checkpoint_freq == 0 and (epoch + 1) < epochs:
+                        self._save_weights_only(self.models_dir / "sin_model.pt")
+
                 except Exception as e:
                     self.logger.error(f"Error during epoch {epoch+1}: {str(e)}", exc_info=True)
                     raise
         
+            self.monitor.finalize()
             best_epoch = self.monitor.get_best_epoch()
             self.logger.info(f"Training complete! Best epoch: {best_epoch}")
             self.save()
+            # Дожидаемся финальной записи: ее ошибка должна дойти до вызывающего
+            self._await_checkpoint()
             return self.monitor.current_log
     
         except Exception as e:
             self.logger.critical(f"Training failed: {str(e)}", exc_info=True)
             raise
 
+    def _load_one_dataset(self, filepath):
+        """Загрузка одного файла данных; None для неподдерживаемых форматов"""
+        if filepath.suffix == '.json':
+            return self.trainer.load_json_data(filepath)
+        if filepath.suffix == '.txt':
+            return self.trainer.load_text_data(filepath)
+        return None
+
     def _load_all_datasets(self):
         datasets = []
-        for filename in os.listdir(self.conversations_dir):
-            filepath = os.path.join(self.conversations_dir, filename)
-            try:
-                if filename.endswith('.json'):
-                    with open(filepath, 'r') as f:
-                        data = json.load(f)
-                        if 'dialogues' in data:
-                            datasets.append(self.trainer.load_json_data(filepath))
-                elif filename.endswith('.txt'):
-                    datasets.append(self.trainer.load_text_data(filepath))
-            except Exception as e:
-                self.logger.error(f"Error loading {filename}: {str(e)}")
-        
+        paths = [p for p in self.conversations_dir.iterdir() if p.is_file()]
+
+        # Чтение и парсинг файлов - чистый I/O, грузим их параллельно;
+        # каждый файл при этом открывается ровно один раз
+        with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+            futures = {executor.submit(self._load_one_dataset, p): p for p in paths}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    dataset = future.result()
+                    if dataset is not None:
+                        datasets.append(dataset)
+                except Exception as e:
+                    self.logger.error(f"Error loading {path.name}: {str(e)}")
+
         return torch.utils.data.ConcatDataset(datasets) if datasets else None
 
+    def _snapshot_checkpoint(self):
+        """Синхронный снимок весов на CPU (до следующего optimizer.step)"""
+        state = {
+            k: v.detach().to('cpu', copy=True)
+            for k, v in self.model.state_dict().items()
+        }
+        return {
+            'model_state': state,
+            'tokenizer_config': {
+                'vocab': self.model.tokenizer.get_vocab(),
+                'special_tokens': self.model.tokenizer.special_tokens_map
+            }
+        }
+
+    @staticmethod
+    def _atomic_torch_save(obj, final_path):
+        """Сериализация в память + одна запись + атомарная замена файла.
+
+        pickle не смешивается с дисковым I/O: torch.save пишет в BytesIO,
+        буфер уходит на диск одним write, и os.replace исключает
+        недописанный чекпоинт.
+        """
+        buf = io.BytesIO()
+        torch.save(obj, buf)
+        tmp_path = final_path.with_suffix(final_path.suffix + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(buf.getbuffer())
+        os.replace(tmp_path, final_path)
+
+    def _save_weights_only(self, path):
+        """Промежуточный чекпоинт без токенизатора и памяти"""
+        self._await_checkpoint()
+        state = {
+            k: v.detach().to('cpu', copy=True)
+            for k, v in self.model.state_dict().items()
+        }
+        self._ckpt_future = self._ckpt_executor.submit(
+            self._atomic_torch_save, {'model_state': state}, path
+        )
+        self._ckpt_future.add_done_callback(self._log_checkpoint_result)
+        self.logger.info(f"Intermediate checkpoint to {path} scheduled in background")
+
+    def _log_checkpoint_result(self, future):
+        """Колбэк фоновой записи: ошибка не должна пропасть молча"""
+        exc = future.exception()
+        if exc is not None:
+            self.logger.error(f"Background checkpoint write failed: {exc}", exc_info=exc)
+
+    def _await_checkpoint(self):
+        """Ожидание предыдущей фоновой записи (не держим больше одного снимка)"""
+        if self._ckpt_future is not None:
+            self._ckpt_future.result()
+            self._ckpt_future = None
+
     def save(self):
         """Сохранение модели и памяти"""
         try:
             self.logger.info("Saving model...")
             model_path = self.models_dir / "sin_model.pt"
-            self.model.save(model_path)
-            self.logger.info(f"Model saved to {model_path}")
-        
+            self._await_checkpoint()
+            checkpoint = self._snapshot_checkpoint()
+            self._ckpt_future = self._ckpt_executor.submit(
+                self._atomic_torch_save, checkpoint, model_path
+            )
+            self._ckpt_future.add_done_callback(self._log_checkpoint_result)
+            self.logger.info(f"Model save to {model_path} scheduled in background")
+
             self.logger.info("Saving memory...")
             memory_path = self.data_dir / "memory.json"
             self.memory.save(memory_path)
@@ -214,22 +351,37 @@ class Sin:
         """Получение отчета о последнем обучении"""
         report_path = Path("data/logs/training_log.json")
         if report_path.exists():
-            with open(report_path, "r") as f:
-                return json.load(f)
+            with open(report_path, "rb") as f:
+                raw = f.read()
+            return orjson.loads(raw) if orjson is not None else json.loads(raw)
         return None
 
     def compare_models(self, model_paths, test_dataset):
         """Сравнение нескольких версий моделей"""
         results = {}
-        original_state = self.model.state_dict()
-        
+        # Снимок исходных весов на CPU один раз: state_dict() возвращает
+        # ссылки на живые тензоры, которые перезаписала бы первая же загрузка
+        original_state = {
+            k: v.detach().to('cpu', copy=True)
+            for k, v in self.model.state_dict().items()
+        }
+        # assign=True подменяет тензоры вместо копирования, но уместно
+        # только когда модель и так живет на CPU
+        assign = self.model.device.type == 'cpu'
+
         try:
             for path in model_paths:
-                self.model.load_state_dict(torch.load(path))
+                # mmap не вычитывает весь файл с диска - тензоры
+                # подгружаются по мере обращения
+                state = torch.load(path, mmap=True, map_location='cpu',
+                                   weights_only=True)
+                if 'model_state' in state:
+                    state = state['model_state']
+                self.model.load_state_dict(state, assign=assign)
                 metrics = self.evaluate(test_dataset)
                 results[Path(path).name] = metrics
-            
-            self.model.load_state_dict(original_state)
+
+            self.model.load_state_dict(original_state, assign=assign)
             
             if len(results) > 1:
                 base = next(iter(results.values()))
@@ -240,7 +392,7 @@ class Sin:
             
             return results
         except Exception as e:
-            self.model.load_state_dict(original_state)
+            self.model.load_state_dict(original_state, assign=assign)
             raise e
 
     def save_model(self, model_name=None):
@@ -252,7 +404,7 @@ class Sin:
                 model_name += '.pt'
             
             model_path = self.models_dir / model_name
-            self.model.save(model_path)
+            self._atomic_torch_save(self._snapshot_checkpoint(), model_path)
             self.logger.info(f"Model manually saved to {model_path}")
             
             # Очистка старых моделей (сохраняем последние 5)
@@ -262,25 +414,29 @@ class Sin:
             self.logger.error(f"Manual save failed: {str(e)}", exc_info=True)
             raise
 
+    def _scan_models(self):
+        """Чекпоинты в models_dir, от новых к старым.
+
+        os.scandir кэширует результаты stat в DirEntry, поэтому сортировка
+        по mtime не делает отдельный syscall на каждый файл, в отличие от
+        glob + Path.stat.
+        """
+        entries = [
+            e for e in os.scandir(self.models_dir)
+            if e.name.endswith('.pt') and e.is_file(follow_symlinks=False)
+        ]
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        return entries
+
     def _cleanup_old_models(self, max_models=5):
         """Удаление старых моделей, кроме max_models последних"""
-        models = sorted(
-            [f for f in self.models_dir.glob('*.pt') if f.is_file()],
-            key=lambda f: f.stat().st_mtime,
-            reverse=True
-        )
-        
-        for old_model in models[max_models:]:
+        for old_entry in self._scan_models()[max_models:]:
             try:
-                old_model.unlink()
-                self.logger.info(f"Removed old model: {old_model}")
+                os.unlink(old_entry.path)
+                self.logger.info(f"Removed old model: {old_entry.path}")
             except Exception as e:
-                self.logger.error(f"Failed to remove {old_model}: {str(e)}")
+                self.logger.error(f"Failed to remove {old_entry.path}: {str(e)}")
 
     def list_models(self):
         """Список доступных моделей"""
-        return [f.name for f in sorted(
-            self.models_dir.glob('*.pt'),
-            key=lambda f: f.stat().st_mtime,
-            reverse=True
-        )]
+        return [e.name for e in self._scan_models()]